@@ -1,9 +1,15 @@
 import streamlit as st
-import json
+import bisect
+import hashlib
 import os
 import io
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from collections import defaultdict
+from copy import deepcopy
 from datetime import datetime
+from itertools import chain
 from dotenv import load_dotenv
 from docx import Document
 from docx.shared import Pt, Inches, RGBColor
@@ -22,26 +28,124 @@ NOTION_PAGE_ID = os.getenv("NOTION_PAGE_ID")
 
 UNITES = ["pièce", "g", "kg", "ml", "cl", "L"]
 
+# Ordre des rayons dans la liste finale (parcours du magasin)
+RAYON_ORDER = [
+    "BOULANGERIE", "LÉGUMES", "FRUITS", "AIL & FINES HERBES",
+    "CHARCUTERIE", "TRAITEUR", "POISSONNERIE", "BOUCHERIE",
+    "SURGELÉS", "FROMAGES", "YAOURTS", "PRODUITS LAITIERS",
+    "ÉPICERIE SALÉE", "CUISINE DU MONDE", "ÉPICERIE SUCRÉE",
+    "BOISSONS", "HYGIÈNE & DIVERS",
+]
+RAYON_ORDER_INDEX = {nom: i for i, nom in enumerate(RAYON_ORDER)}
+
 
 # --- Chargement / sauvegarde ---
-def load_recettes():
-    with open(RECETTES_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)["plats"]
+def file_version(path):
+    """Version d'un fichier JSON (mtime en ns), utilisée comme clé de cache.
+    Les caches qui en dépendent gardent une seule entrée : seule la version courante sert.
+    """
+    return os.stat(path).st_mtime_ns
+
+
+@st.cache_data(max_entries=1)
+def load_recettes(version):
+    with open(RECETTES_PATH, "rb") as f:
+        plats = orjson.loads(f.read())["plats"]
+    # Nom normalisé calculé une fois au chargement (fusion des ingrédients)
+    for plat in plats:
+        for ing in plat["ingredients"]:
+            ing["_nom_lc"] = ing["nom"].casefold()
+    return plats
+
+
+@st.cache_data(max_entries=1)
+def load_catalogue(version):
+    with open(CATALOGUE_PATH, "rb") as f:
+        rayons = orjson.loads(f.read())["rayons"]
+    for rayon in rayons:
+        index_rayon(rayon)
+    return rayons
+
+
+def index_rayon(rayon):
+    """Trie les articles d'un rayon et y attache la liste parallèle de leurs noms normalisés (casefold).
+    rayon["_articles_lc"] reste triée, ce qui permet bisect pour chercher/insérer.
+    """
+    articles_lc = [a.casefold() for a in rayon["articles"]]
+    order = sorted(range(len(articles_lc)), key=articles_lc.__getitem__)
+    rayon["articles"] = [rayon["articles"][i] for i in order]
+    rayon["_articles_lc"] = [articles_lc[i] for i in order]
+
+
+@st.cache_resource
+def last_written():
+    """Dernière écriture de chaque fichier JSON : {chemin: (version, empreinte du contenu)}."""
+    return {}
+
+
+def write_json(path, data):
+    """Écrit data en JSON via un fichier temporaire + os.replace (pas de fichier à moitié écrit).
+    Ne fait rien si le contenu est identique à la dernière écriture et que le fichier n'a pas bougé.
+    Retourne True si le fichier a été réécrit.
+    """
+    content = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    digest = hashlib.blake2b(content, digest_size=16).digest()
+    written = last_written()
+    if os.path.exists(path) and written.get(path) == (file_version(path), digest):
+        return False
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    finally:
+        # En cas d'échec, ne pas laisser le fichier temporaire à côté des données
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    written[path] = (file_version(path), digest)
+    return True
 
 
-def load_catalogue():
-    with open(CATALOGUE_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)["rayons"]
+def without_index_fields(data):
+    """Copie d'un dict sans les champs préfixés par "_" (index calculés au chargement, pas des données)."""
+    return {k: v for k, v in data.items() if not k.startswith("_")}
 
 
 def save_recettes(plats):
-    with open(RECETTES_PATH, "w", encoding="utf-8") as f:
-        json.dump({"plats": plats}, f, ensure_ascii=False, indent=2)
+    plats = [
+        {**p, "ingredients": [without_index_fields(ing) for ing in p["ingredients"]]}
+        for p in plats
+    ]
+    if write_json(RECETTES_PATH, {"plats": plats}):
+        load_recettes.clear()
 
 
 def save_catalogue(rayons):
-    with open(CATALOGUE_PATH, "w", encoding="utf-8") as f:
-        json.dump({"rayons": rayons}, f, ensure_ascii=False, indent=2)
+    rayons = [without_index_fields(r) for r in rayons]
+    if write_json(CATALOGUE_PATH, {"rayons": rayons}):
+        load_catalogue.clear()
+
+
+def memo_by_version(name, version, build):
+    """Mémorise build() dans session_state tant que la version du fichier ne change pas.
+    Pour de petites structures dérivées, c'est bien moins coûteux qu'un appel st.cache_* à chaque rerun.
+    """
+    cached = st.session_state.get(name)
+    if cached is None or cached[0] != version:
+        cached = (version, build())
+        st.session_state[name] = cached
+    return cached[1]
+
+
+def sort_recettes(recettes):
+    """Ordre alphabétique des recettes et leurs noms normalisés.
+    Retourne (order, noms_lc) : indices dans recettes et noms triés, deux listes parallèles.
+    Les articles du catalogue portent déjà leur équivalent (rayon["_articles_lc"]).
+    """
+    noms_lc = [r["nom"].casefold() for r in recettes]
+    order = sorted(range(len(recettes)), key=noms_lc.__getitem__)
+    return order, [noms_lc[i] for i in order]
 
 
 # --- Utilitaires ---
@@ -59,49 +163,39 @@ def merge_ingredients(ingredients_list):
     Entrée: liste de {"nom", "rayon", "quantite", "unite"}
     Retourne: {rayon: [(nom, quantite, unite), ...]}
     """
-    merged = {}
+    # (nom normalisé, rayon, unité) → [nom affiché, quantité cumulée]
+    # Unités différentes → clés différentes, donc gardées séparées
+    acc = {}
     for ing in ingredients_list:
-        nom = ing["nom"]
-        rayon = ing["rayon"]
-        qty = ing.get("quantite", 1)
-        unite = ing.get("unite", "pièce")
-        key = (nom.lower(), rayon)
-
-        if key in merged:
-            if merged[key]["unite"] == unite:
-                merged[key]["quantite"] += qty
-            else:
-                # Unités différentes → garder séparés (ajouter comme nouvel item)
-                alt_key = (nom.lower() + f"_{unite}", rayon)
-                if alt_key in merged:
-                    merged[alt_key]["quantite"] += qty
-                else:
-                    merged[alt_key] = {
-                        "rayon": rayon,
-                        "nom": nom,
-                        "quantite": qty,
-                        "unite": unite,
-                    }
+        key = (ing.get("_nom_lc") or ing["nom"].casefold(), ing["rayon"], ing.get("unite", "pièce"))
+        entry = acc.get(key)
+        if entry is None:
+            acc[key] = [ing["nom"], ing.get("quantite", 1)]
         else:
-            merged[key] = {
-                "rayon": rayon,
-                "nom": nom,
-                "quantite": qty,
-                "unite": unite,
-            }
+            entry[1] += ing.get("quantite", 1)
 
-    result = {}
-    for data in merged.values():
-        rayon = data["rayon"]
-        if rayon not in result:
-            result[rayon] = []
-        result[rayon].append((data["nom"], data["quantite"], data["unite"]))
+    result = defaultdict(list)
+    for (_, rayon, unite), (nom, qty) in acc.items():
+        result[rayon].append((nom, qty, unite))
 
     # Trier par nom au sein de chaque rayon
-    for rayon in result:
-        result[rayon].sort(key=lambda x: x[0].lower())
+    for items in result.values():
+        items.sort(key=lambda x: x[0].casefold())
+
+    return dict(result)
 
-    return result
+
+def build_recipe_tooltips(recettes):
+    """Liste des ingrédients de chaque recette pour l'infobulle.
+    Retourne {nom de la recette: "Carottes (450g), Poulet, ..."}
+    """
+    return {
+        r["nom"]: ", ".join(
+            format_item(ing["nom"], ing.get("quantite", 1), ing.get("unite", "pièce"))
+            for ing in r["ingredients"]
+        )
+        for r in recettes
+    }
 
 
 def get_recipe_ingredients(recettes, selected_names):
@@ -113,65 +207,38 @@ def get_recipe_ingredients(recettes, selected_names):
     return ingredients
 
 
-def build_final_list(recipe_items_by_rayon, free_items_by_rayon):
-    """Combine recettes + produits libres, par rayon.
-    Les deux entrées sont {rayon: [(nom, quantite, unite), ...]}
-    Retourne le même format, fusionné et trié par rayon.
-    """
-    # Rassembler tous les items dans une seule liste pour fusion
-    all_items = []
-    for rayon, items in recipe_items_by_rayon.items():
-        for nom, qty, unite in items:
-            all_items.append({"nom": nom, "rayon": rayon, "quantite": qty, "unite": unite})
-    for rayon, items in free_items_by_rayon.items():
+def iter_items_by_rayon(items_by_rayon):
+    """Parcourt {rayon: [(nom, quantite, unite), ...]} sous forme d'ingrédients structurés."""
+    for rayon, items in items_by_rayon.items():
         for nom, qty, unite in items:
-            all_items.append({"nom": nom, "rayon": rayon, "quantite": qty, "unite": unite})
-
-    merged = merge_ingredients(all_items)
+            yield {"nom": nom, "rayon": rayon, "quantite": qty, "unite": unite}
 
-    # Ordonner par rayon
-    rayon_order = [
-        "BOULANGERIE", "LÉGUMES", "FRUITS", "AIL & FINES HERBES",
-        "CHARCUTERIE", "TRAITEUR", "POISSONNERIE", "BOUCHERIE",
-        "SURGELÉS", "FROMAGES", "YAOURTS", "PRODUITS LAITIERS",
-        "ÉPICERIE SALÉE", "CUISINE DU MONDE", "ÉPICERIE SUCRÉE",
-        "BOISSONS", "HYGIÈNE & DIVERS",
-    ]
-
-    final = {}
-    for rayon in rayon_order:
-        if rayon in merged:
-            final[rayon] = merged[rayon]
 
-    for rayon in sorted(set(merged.keys()) - set(rayon_order)):
-        final[rayon] = merged[rayon]
+def build_final_list(recipe_ingredients, free_items_by_rayon):
+    """Combine recettes + produits libres, par rayon.
+    recipe_ingredients: liste de {"nom", "rayon", "quantite", "unite"}
+    free_items_by_rayon: {rayon: [(nom, quantite, unite), ...]}
+    Retourne {rayon: [(nom, quantite, unite), ...]}, fusionné et trié par rayon.
+    """
+    merged = merge_ingredients(chain(recipe_ingredients, iter_items_by_rayon(free_items_by_rayon)))
 
-    return final
+    # Ordonner par rayon (rayons inconnus à la fin, par ordre alphabétique)
+    return dict(sorted(
+        merged.items(),
+        key=lambda kv: (RAYON_ORDER_INDEX.get(kv[0], len(RAYON_ORDER)), kv[0]),
+    ))
 
 
-def subtract_stock(final_list, stock_items):
+def subtract_stock(final_list, stock_index):
     """Soustrait le stock de la liste finale.
-    stock_items: {rayon: [(nom, quantite, unite), ...]}
+    stock_index: {(nom.casefold(), rayon): {"quantite", "unite"}}, tenu à jour par l'onglet stock
     Retourne la liste finale nettoyée.
     """
-    # Indexer le stock par (nom.lower(), rayon)
-    stock_index = {}
-    for rayon, items in stock_items.items():
-        for nom, qty, unite in items:
-            key = (nom.lower(), rayon)
-            if key in stock_index:
-                if stock_index[key]["unite"] == unite:
-                    stock_index[key]["quantite"] += qty
-                else:
-                    stock_index[key] = {"quantite": qty, "unite": unite}
-            else:
-                stock_index[key] = {"quantite": qty, "unite": unite}
-
     result = {}
     for rayon, items in final_list.items():
         new_items = []
         for nom, qty, unite in items:
-            key = (nom.lower(), rayon)
+            key = (nom.casefold(), rayon)
             if key in stock_index:
                 stock = stock_index[key]
                 if stock["unite"] == unite:
@@ -192,28 +259,42 @@ def subtract_stock(final_list, stock_items):
 
 def add_ingredient_to_catalogue(catalogue, nom_ingredient, rayon_nom):
     """Ajoute un ingrédient au catalogue s'il n'y est pas déjà."""
+    nom_lc = nom_ingredient.casefold()
     for rayon in catalogue:
         if rayon["nom"] == rayon_nom:
-            existing_lower = [a.lower() for a in rayon["articles"]]
-            if nom_ingredient.lower() not in existing_lower:
-                rayon["articles"].append(nom_ingredient)
-                rayon["articles"].sort(key=str.lower)
-                return True
-            return False
-    catalogue.append({"nom": rayon_nom, "articles": [nom_ingredient]})
+            articles_lc = rayon["_articles_lc"]
+            pos = bisect.bisect_left(articles_lc, nom_lc)
+            if pos < len(articles_lc) and articles_lc[pos] == nom_lc:
+                return False
+            articles_lc.insert(pos, nom_lc)
+            rayon["articles"].insert(pos, nom_ingredient)
+            return True
+    catalogue.append({
+        "nom": rayon_nom,
+        "articles": [nom_ingredient],
+        "_articles_lc": [nom_lc],
+    })
     return True
 
 
+@st.cache_resource
+def get_notion_session():
+    """Session HTTP partagée entre les reruns pour réutiliser la connexion TLS vers Notion."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Notion-Version": "2022-06-28",
+    })
+    return session
+
+
 def export_to_notion(final_list, selected_recipes):
     """Crée une page Notion avec des cases à cocher via l'API."""
     if not NOTION_TOKEN or not NOTION_PAGE_ID:
         return False, "Configuration Notion manquante. Vérifiez le fichier .env.", None
 
-    headers = {
-        "Authorization": f"Bearer {NOTION_TOKEN}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28",
-    }
+    headers = {"Authorization": f"Bearer {NOTION_TOKEN}"}
 
     date_str = datetime.now().strftime("%d/%m/%Y")
     title = f"🛒 Liste de courses — {date_str}"
@@ -261,8 +342,10 @@ def export_to_notion(final_list, selected_recipes):
         "children": children[:100],
     }
 
+    session = get_notion_session()
+
     try:
-        resp = requests.post(
+        resp = session.post(
             "https://api.notion.com/v1/pages",
             headers=headers,
             json=payload,
@@ -270,13 +353,15 @@ def export_to_notion(final_list, selected_recipes):
         )
 
         if resp.status_code == 200:
-            page_url = resp.json().get("url", "")
+            page = resp.json()
+            page_url = page.get("url", "")
 
             if len(children) > 100:
-                page_id = resp.json()["id"]
+                page_id = page["id"]
+                # Envois séquentiels : des appels concurrents ajouteraient les blocs dans le désordre
                 for i in range(100, len(children), 100):
                     batch = children[i:i+100]
-                    requests.patch(
+                    session.patch(
                         f"https://api.notion.com/v1/blocks/{page_id}/children",
                         headers=headers,
                         json={"children": batch},
@@ -285,7 +370,11 @@ def export_to_notion(final_list, selected_recipes):
 
             return True, "Page créée dans Notion !", page_url
         else:
-            error = resp.json().get("message", resp.text)
+            try:
+                error = resp.json().get("message", resp.text)
+            except ValueError:
+                # Réponse non JSON (proxy, page d'erreur HTML...)
+                error = resp.text
             return False, f"Erreur Notion : {error}", None
 
     except requests.exceptions.Timeout:
@@ -295,7 +384,19 @@ def export_to_notion(final_list, selected_recipes):
 
 
 def export_to_docx(final_list, selected_recipes):
-    """Génère un fichier Word de la liste de courses."""
+    """Génère un fichier Word de la liste de courses.
+    Le document n'est reconstruit que si la liste, les plats ou la date changent.
+    """
+    final_items = tuple((rayon, tuple(items)) for rayon, items in final_list.items())
+    date_str = datetime.now().strftime("%d/%m/%Y")
+    return io.BytesIO(build_docx_bytes(final_items, tuple(selected_recipes), date_str))
+
+
+@st.cache_data(max_entries=20)
+def build_docx_bytes(final_items, selected_recipes, date_str):
+    """Construit le fichier Word et retourne son contenu.
+    final_items: ((rayon, ((nom, quantite, unite), ...)), ...)
+    """
     doc = Document()
 
     style = doc.styles["Normal"]
@@ -309,7 +410,7 @@ def export_to_docx(final_list, selected_recipes):
 
     date_para = doc.add_paragraph()
     date_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    date_run = date_para.add_run(f"Semaine du {datetime.now().strftime('%d/%m/%Y')}")
+    date_run = date_para.add_run(f"Semaine du {date_str}")
     date_run.font.size = Pt(10)
     date_run.font.color.rgb = RGBColor(100, 100, 100)
 
@@ -325,27 +426,45 @@ def export_to_docx(final_list, selected_recipes):
 
     doc.add_paragraph()
 
-    for rayon, items in final_list.items():
+    # Modèle de puce (style + run vide en 11 pt) construit une fois via python-docx puis retiré
+    # du document ; chaque article en est une copie XML dont seul le texte du run change
+    template_para = doc.add_paragraph(style="List Bullet")
+    template_para.add_run().font.size = Pt(11)
+    bullet_template = template_para._p
+    bullet_template.getparent().remove(bullet_template)
+
+    for rayon, items in final_items:
         heading = doc.add_heading(rayon, level=2)
         for run in heading.runs:
             run.font.color.rgb = RGBColor(46, 117, 182)
             run.font.size = Pt(13)
 
+        last_p = heading._p
         for nom, qty, unite in items:
-            display = format_item(nom, qty, unite)
-            para = doc.add_paragraph(style="List Bullet")
-            run = para.add_run(display)
-            run.font.size = Pt(11)
+            new_p = deepcopy(bullet_template)
+            # Même setter que run.text : gère xml:space="preserve", tabulations et retours à la ligne
+            new_p.r_lst[0].text = format_item(nom, qty, unite)
+            last_p.addnext(new_p)
+            last_p = new_p
 
     buffer = io.BytesIO()
     doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+    return buffer.getvalue()
 
 
 # --- Chargement ---
-recettes = load_recettes()
-catalogue = load_catalogue()
+# Les fichiers ne sont relus que si leur date de modification change
+recettes_version = file_version(RECETTES_PATH)
+catalogue_version = file_version(CATALOGUE_PATH)
+recettes = load_recettes(recettes_version)
+catalogue = load_catalogue(catalogue_version)
+recettes_order, recettes_lc = memo_by_version(
+    "sorted_recettes_cache", recettes_version, lambda: sort_recettes(recettes)
+)
+recettes_triees_all = [recettes[i] for i in recettes_order]
+recettes_tooltips = memo_by_version(
+    "recipe_tooltips_cache", recettes_version, lambda: build_recipe_tooltips(recettes)
+)
 
 # --- Session state ---
 if "checked_items" not in st.session_state:
@@ -354,6 +473,43 @@ if "new_recipe_ingredients" not in st.session_state:
     st.session_state.new_recipe_ingredients = []
 if "editing_recipe" not in st.session_state:
     st.session_state.editing_recipe = None
+if "checked_cat_items" not in st.session_state:
+    st.session_state.checked_cat_items = {}
+if "checked_stock_keys" not in st.session_state:
+    st.session_state.checked_stock_keys = set()
+if "checked_stock_index" not in st.session_state:
+    st.session_state.checked_stock_index = {}
+
+
+def update_product(rayon_nom, article):
+    """Callback de l'onglet produits (case, quantité, unité) : tient à jour
+    checked_cat_items {(rayon, article): {"quantite", "unite"}}.
+    """
+    item = (rayon_nom, article)
+    if st.session_state.get(f"cat_{rayon_nom}_{article}", False):
+        st.session_state.checked_cat_items[item] = {
+            "quantite": st.session_state.get(f"qty_{rayon_nom}_{article}", 1),
+            "unite": st.session_state.get(f"unit_{rayon_nom}_{article}", "pièce"),
+        }
+    else:
+        st.session_state.checked_cat_items.pop(item, None)
+
+
+def update_stock(rayon_nom, article):
+    """Callback de l'onglet stock (case, quantité, unité) : tient à jour
+    checked_stock_keys et checked_stock_index sans reparcourir tout le stock.
+    """
+    item = (rayon_nom, article)
+    index_key = (article.casefold(), rayon_nom)
+    if st.session_state.get(f"stock_{rayon_nom}_{article}", False):
+        st.session_state.checked_stock_keys.add(item)
+        st.session_state.checked_stock_index[index_key] = {
+            "quantite": st.session_state.get(f"stock_qty_{rayon_nom}_{article}", 1),
+            "unite": st.session_state.get(f"stock_unit_{rayon_nom}_{article}", "pièce"),
+        }
+    else:
+        st.session_state.checked_stock_keys.discard(item)
+        st.session_state.checked_stock_index.pop(index_key, None)
 
 
 # --- Interface ---
@@ -374,20 +530,18 @@ with tab_recettes:
         placeholder="Ex : quiche, poulet...",
     )
 
-    recettes_triees = sorted(recettes, key=lambda r: r["nom"].lower())
+    recettes_triees = recettes_triees_all
     if search_recettes.strip():
-        q = search_recettes.strip().lower()
-        recettes_triees = [r for r in recettes_triees if q in r["nom"].lower()]
+        q = search_recettes.strip().casefold()
+        recettes_triees = [
+            r for r, nom_lc in zip(recettes_triees_all, recettes_lc) if q in nom_lc
+        ]
 
     for recette in recettes_triees:
-        ingredients_str = ", ".join(
-            format_item(ing["nom"], ing.get("quantite", 1), ing.get("unite", "pièce"))
-            for ing in recette["ingredients"]
-        )
         st.checkbox(
             recette["nom"],
             key=f"recette_{recette['nom']}",
-            help=ingredients_str,
+            help=recettes_tooltips[recette["nom"]],
         )
 
     _selected = [r["nom"] for r in recettes if st.session_state.get(f"recette_{r['nom']}", False)]
@@ -398,7 +552,7 @@ with tab_recettes:
         _by_rayon = merge_ingredients(_ingredients)
         for rayon, items in sorted(_by_rayon.items()):
             st.markdown(f"**{rayon}**")
-            for nom, qty, unite in sorted(items, key=lambda x: x[0].lower()):
+            for nom, qty, unite in items:
                 st.markdown(f"- {format_item(nom, qty, unite)}")
 
 @st.dialog("Confirmer la suppression")
@@ -409,9 +563,14 @@ def confirm_delete_product(rayon_nom, article):
         if st.button("Oui, supprimer", type="primary"):
             for r in catalogue:
                 if r["nom"] == rayon_nom and article in r["articles"]:
-                    r["articles"].remove(article)
+                    pos = r["articles"].index(article)
+                    del r["articles"][pos]
+                    del r["_articles_lc"][pos]
                     save_catalogue(catalogue)
                     break
+            st.session_state.checked_cat_items.pop((rayon_nom, article), None)
+            st.session_state.checked_stock_keys.discard((rayon_nom, article))
+            st.session_state.checked_stock_index.pop((article.casefold(), rayon_nom), None)
             st.rerun()
     with col_no:
         if st.button("Annuler"):
@@ -446,33 +605,46 @@ with tab_produits:
         placeholder="Ex : yaourt, tomate...",
     )
 
-    q_produits = search_produits.strip().lower() if search_produits.strip() else ""
+    q_produits = search_produits.strip().casefold() if search_produits.strip() else ""
 
     for rayon in catalogue:
         if q_produits:
-            matching = [(j, a) for j, a in enumerate(rayon["articles"]) if q_produits in a.lower()]
+            matching = [
+                a for a, a_lc in zip(rayon["articles"], rayon["_articles_lc"]) if q_produits in a_lc
+            ]
             if not matching:
                 continue
         else:
-            matching = list(enumerate(rayon["articles"]))
+            matching = rayon["articles"]
 
         with st.expander(f"🏷️ {rayon['nom']} ({len(matching)} articles)", expanded=bool(q_produits)):
-            for j, article in matching:
-                cat_key = f"cat_{rayon['nom']}_{j}"
-                qty_key = f"qty_{rayon['nom']}_{j}"
-                unit_key = f"unit_{rayon['nom']}_{j}"
+            for article in matching:
+                cat_key = f"cat_{rayon['nom']}_{article}"
+                qty_key = f"qty_{rayon['nom']}_{article}"
+                unit_key = f"unit_{rayon['nom']}_{article}"
                 del_key = f"del_{rayon['nom']}_{article}"
+                # Quantité/unité relues depuis checked_cat_items : l'état des widgets masqués
+                # par la recherche est perdu, alors que l'entrée cochée le conserve
+                product = st.session_state.checked_cat_items.get((rayon["nom"], article))
 
                 col_check, col_qty, col_unit, col_del = st.columns([5, 1, 1, 0.5])
                 with col_check:
-                    checked = st.checkbox(article, key=cat_key)
+                    checked = st.checkbox(
+                        article,
+                        key=cat_key,
+                        value=product is not None,
+                        on_change=update_product,
+                        args=(rayon["nom"], article),
+                    )
                 with col_qty:
                     if checked:
                         st.number_input(
                             "Qté",
                             min_value=1,
-                            value=st.session_state.get(qty_key, 1),
+                            value=product["quantite"] if product else 1,
                             key=qty_key,
+                            on_change=update_product,
+                            args=(rayon["nom"], article),
                             label_visibility="collapsed",
                         )
                 with col_unit:
@@ -480,8 +652,10 @@ with tab_produits:
                         st.selectbox(
                             "Unité",
                             options=UNITES,
-                            index=0,
+                            index=UNITES.index(product["unite"]) if product else 0,
                             key=unit_key,
+                            on_change=update_product,
+                            args=(rayon["nom"], article),
                             label_visibility="collapsed",
                         )
                 with col_del:
@@ -500,32 +674,45 @@ with tab_stock:
         placeholder="Ex : crème, riz...",
     )
 
-    q_stock = search_stock.strip().lower() if search_stock.strip() else ""
+    q_stock = search_stock.strip().casefold() if search_stock.strip() else ""
 
     for rayon in catalogue:
         if q_stock:
-            matching = [(j, a) for j, a in enumerate(rayon["articles"]) if q_stock in a.lower()]
+            matching = [
+                a for a, a_lc in zip(rayon["articles"], rayon["_articles_lc"]) if q_stock in a_lc
+            ]
             if not matching:
                 continue
         else:
-            matching = list(enumerate(rayon["articles"]))
+            matching = rayon["articles"]
 
         with st.expander(f"🏷️ {rayon['nom']} ({len(matching)} articles)", expanded=bool(q_stock)):
-            for j, article in matching:
-                stock_key = f"stock_{rayon['nom']}_{j}"
-                stock_qty_key = f"stock_qty_{rayon['nom']}_{j}"
-                stock_unit_key = f"stock_unit_{rayon['nom']}_{j}"
+            for article in matching:
+                stock_key = f"stock_{rayon['nom']}_{article}"
+                stock_qty_key = f"stock_qty_{rayon['nom']}_{article}"
+                stock_unit_key = f"stock_unit_{rayon['nom']}_{article}"
+                # Quantité/unité relues depuis checked_stock_index : l'état des widgets masqués par la
+                # recherche est perdu, alors que l'index garde ce qui est soustrait de la liste
+                stock = st.session_state.checked_stock_index.get((article.casefold(), rayon["nom"]), {})
 
                 col_check, col_qty, col_unit = st.columns([3, 1, 1])
                 with col_check:
-                    checked = st.checkbox(article, key=stock_key)
+                    checked = st.checkbox(
+                        article,
+                        key=stock_key,
+                        value=(rayon["nom"], article) in st.session_state.checked_stock_keys,
+                        on_change=update_stock,
+                        args=(rayon["nom"], article),
+                    )
                 with col_qty:
                     if checked:
                         st.number_input(
                             "Qté",
                             min_value=1,
-                            value=st.session_state.get(stock_qty_key, 1),
+                            value=stock.get("quantite", 1),
                             key=stock_qty_key,
+                            on_change=update_stock,
+                            args=(rayon["nom"], article),
                             label_visibility="collapsed",
                         )
                 with col_unit:
@@ -533,8 +720,10 @@ with tab_stock:
                         st.selectbox(
                             "Unité",
                             options=UNITES,
-                            index=0,
+                            index=UNITES.index(stock.get("unite", "pièce")),
                             key=stock_unit_key,
+                            on_change=update_stock,
+                            args=(rayon["nom"], article),
                             label_visibility="collapsed",
                         )
 
@@ -544,7 +733,7 @@ with tab_stock:
 with tab_gerer:
     st.header("Gérer les recettes")
 
-    recettes_noms = sorted([r["nom"] for r in recettes], key=str.lower)
+    recettes_noms = [r["nom"] for r in recettes_triees_all]
     options = ["-- Nouvelle recette --"] + recettes_noms
 
     select_index = 0
@@ -645,8 +834,8 @@ with tab_gerer:
                         st.error("Donnez un nom à la recette.")
                     else:
                         new_name = recipe_name.strip()
-                        existing_names = [r["nom"].lower() for r in recettes if r["nom"] != choix]
-                        if new_name.lower() in existing_names:
+                        existing_names = [r["nom"].casefold() for r in recettes if r["nom"] != choix]
+                        if new_name.casefold() in existing_names:
                             st.error(f"La recette « {new_name} » existe déjà.")
                         else:
                             for r in recettes:
@@ -693,8 +882,7 @@ with tab_gerer:
                 if not recipe_name.strip():
                     st.error("Donnez un nom à la recette.")
                 else:
-                    existing_names = [r["nom"].lower() for r in recettes]
-                    if recipe_name.strip().lower() in existing_names:
+                    if recipe_name.strip().casefold() in recettes_lc:
                         st.error(f"La recette « {recipe_name.strip()} » existe déjà.")
                     else:
                         new_recipe = {
@@ -719,54 +907,56 @@ with tab_gerer:
         st.caption("Ajoutez des ingrédients via le formulaire ci-dessus.")
 
 # ============================================
-# CALCUL DE LA LISTE FINALE (hors des tabs)
+# CALCUL DE LA LISTE FINALE
 # ============================================
-selected_recipes_final = []
-for recette in recettes:
-    if st.session_state.get(f"recette_{recette['nom']}", False):
-        selected_recipes_final.append(recette["nom"])
-
-recipe_ingredients_final = get_recipe_ingredients(recettes, selected_recipes_final)
-recipe_by_rayon_final = merge_ingredients(recipe_ingredients_final)
-
-# Produits cochés avec quantités et unités
-free_items_final = {}
-for rayon in catalogue:
-    items = []
-    for j, article in enumerate(rayon["articles"]):
-        cat_key = f"cat_{rayon['nom']}_{j}"
-        qty_key = f"qty_{rayon['nom']}_{j}"
-        unit_key = f"unit_{rayon['nom']}_{j}"
-        if st.session_state.get(cat_key, False):
-            qty = st.session_state.get(qty_key, 1)
-            unite = st.session_state.get(unit_key, "pièce")
-            items.append((article, qty, unite))
-    if items:
-        free_items_final[rayon["nom"]] = items
-
-final_list_before_stock = build_final_list(recipe_by_rayon_final, free_items_final)
-
-# Stock : produits déjà en possession
-stock_items_final = {}
-for rayon in catalogue:
-    items = []
-    for j, article in enumerate(rayon["articles"]):
-        stock_key = f"stock_{rayon['nom']}_{j}"
-        stock_qty_key = f"stock_qty_{rayon['nom']}_{j}"
-        stock_unit_key = f"stock_unit_{rayon['nom']}_{j}"
-        if st.session_state.get(stock_key, False):
-            qty = st.session_state.get(stock_qty_key, 1)
-            unite = st.session_state.get(stock_unit_key, "pièce")
-            items.append((article, qty, unite))
-    if items:
-        stock_items_final[rayon["nom"]] = items
-
-final_list = subtract_stock(final_list_before_stock, stock_items_final)
+def compute_final_list():
+    """Calcule la liste finale : recettes sélectionnées + produits cochés - stock.
+    Retourne (final_list, selected_recipes_final).
+    """
+    selected_recipes_final = []
+    for recette in recettes:
+        if st.session_state.get(f"recette_{recette['nom']}", False):
+            selected_recipes_final.append(recette["nom"])
+
+    # Produits cochés avec quantités et unités (seuls les articles cochés sont parcourus)
+    free_checked = sorted(
+        (rayon_nom, article, product["quantite"], product["unite"])
+        for (rayon_nom, article), product in st.session_state.checked_cat_items.items()
+    )
+    stock_checked = sorted(
+        (rayon_nom, nom_lc, stock["quantite"], stock["unite"])
+        for (nom_lc, rayon_nom), stock in st.session_state.checked_stock_index.items()
+    )
+
+    # La fusion et la soustraction du stock ne sont refaites que si l'une des entrées a changé
+    state_fp = (recettes_version, tuple(selected_recipes_final), tuple(free_checked), tuple(stock_checked))
+    final_cache = st.session_state.get("final_list_cache")
+    if final_cache is not None and final_cache[0] == state_fp:
+        final_list = final_cache[1]
+    else:
+        recipe_ingredients_final = get_recipe_ingredients(recettes, selected_recipes_final)
+
+        free_items_final = {}
+        for rayon_nom, article, qty, unite in free_checked:
+            free_items_final.setdefault(rayon_nom, []).append((article, qty, unite))
+
+        final_list_before_stock = build_final_list(recipe_ingredients_final, free_items_final)
+
+        # Stock : produits déjà en possession
+        final_list = subtract_stock(final_list_before_stock, st.session_state.checked_stock_index)
+        st.session_state.final_list_cache = (state_fp, final_list)
+
+    return final_list, selected_recipes_final
+
 
 # =====================
 # ONGLET 3 : MA LISTE
 # =====================
-with tab_liste:
+# Fragment : cocher un article ou utiliser un bouton de l'onglet ne réexécute que cette fonction,
+# pas les autres onglets (un st.rerun() reste une réexécution complète)
+@st.fragment
+def render_liste():
+    final_list, selected_recipes_final = compute_final_list()
 
     if final_list:
         st.header("📋 Ma liste de courses")
@@ -827,6 +1017,9 @@ with tab_liste:
         with col3:
             if st.button("🗑️ Tout réinitialiser"):
                 st.session_state.checked_items = set()
+                st.session_state.checked_cat_items = {}
+                st.session_state.checked_stock_keys = set()
+                st.session_state.checked_stock_index = {}
                 # Supprimer les recettes, produits, stock et coches
                 keys_to_delete = []
                 for k in st.session_state:
@@ -843,3 +1036,7 @@ with tab_liste:
             "👈 Sélectionnez des recettes dans l'onglet **Recettes** "
             "ou ajoutez des articles depuis les **Produits** pour constituer votre liste."
         )
+
+
+with tab_liste:
+    render_liste()